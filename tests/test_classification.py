@@ -0,0 +1,233 @@
+import pytest
+
+from weak_nlp import CNLM, ClassificationAssociation, SourceVector
+from weak_nlp.shared import exceptions
+
+
+def test_empty_noisy_vectors():
+    cnlm = CNLM(
+        [
+            SourceVector("reference", True, [ClassificationAssociation("r1", "a")]),
+            SourceVector("heuristic", False, []),
+        ]
+    )
+    assert cnlm.quantity_metrics().empty
+    with pytest.raises(exceptions.MissingStatsException):
+        cnlm.weakly_supervise()
+
+
+def test_duplicate_identifiers_keep_all_associations():
+    cnlm = CNLM(
+        [
+            SourceVector("h", False, [ClassificationAssociation("r1", "a")]),
+            SourceVector(
+                "h",
+                False,
+                [
+                    ClassificationAssociation("r1", "b"),
+                    ClassificationAssociation("r2", "b"),
+                ],
+            ),
+        ]
+    )
+    assert set(cnlm.quantity_metrics()["label_name"]) == {"a", "b"}
+
+
+def create_vectors():
+    return [
+        SourceVector(
+            "reference",
+            True,
+            [
+                ClassificationAssociation("r1", "a"),
+                ClassificationAssociation("r2", "b"),
+                ClassificationAssociation("r3", "a"),
+                ClassificationAssociation("r4", "b"),
+            ],
+        ),
+        SourceVector(
+            "h1",
+            False,
+            [
+                ClassificationAssociation("r1", "a", 0.9),
+                ClassificationAssociation("r2", "a", 0.8),
+                ClassificationAssociation("r3", "a"),
+                ClassificationAssociation("r5", "b"),
+            ],
+        ),
+        SourceVector(
+            "h2",
+            False,
+            [
+                ClassificationAssociation("r1", "a"),
+                ClassificationAssociation("r2", "b"),
+                ClassificationAssociation("r4", "b", 0.5),
+                ClassificationAssociation("r5", "a"),
+                ClassificationAssociation("r9", "a"),
+            ],
+        ),
+        SourceVector(  # no overlap with the reference
+            "h3",
+            False,
+            [
+                ClassificationAssociation("r6", "b"),
+                ClassificationAssociation("r7", "a"),
+            ],
+        ),
+        SourceVector(  # ties with h2 on r9
+            "h4",
+            False,
+            [
+                ClassificationAssociation("r2", "b"),
+                ClassificationAssociation("r4", "b"),
+                ClassificationAssociation("r9", "b"),
+            ],
+        ),
+    ]
+
+
+def create_int_label_vectors():
+    return [
+        SourceVector(
+            "reference",
+            True,
+            [ClassificationAssociation("r1", 1), ClassificationAssociation("r2", 2)],
+        ),
+        SourceVector(
+            "h1",
+            False,
+            [
+                ClassificationAssociation("r1", 1, 0.7),
+                ClassificationAssociation("r2", 1),
+                ClassificationAssociation("r3", 2),
+            ],
+        ),
+        SourceVector(
+            "h2",
+            False,
+            [
+                ClassificationAssociation("r2", 2, 0.6),
+                ClassificationAssociation("r3", 2),
+            ],
+        ),
+    ]
+
+
+def to_rows(df):
+    return list(df.itertuples(index=False, name=None))
+
+
+def test_quality_metrics():
+    stats_df = CNLM(create_vectors()).quality_metrics()
+    assert list(stats_df.columns) == [
+        "identifier",
+        "label_name",
+        "true_positives",
+        "false_positives",
+        "precision",
+    ]
+    assert to_rows(stats_df) == [
+        ("h1", "a", 2, 1, pytest.approx(2 / 3)),
+        ("h1", "b", 0, 0, 0.0),
+        ("h2", "a", 1, 0, 1.0),
+        ("h2", "b", 2, 0, 1.0),
+        ("h3", "b", 0, 0, 0.0),
+        ("h3", "a", 0, 0, 0.0),
+        ("h4", "b", 2, 0, 1.0),
+        ("h4", "a", 0, 0, 0.0),
+    ]
+
+
+def test_quantity_metrics():
+    stats_df = CNLM(create_vectors()).quantity_metrics()
+    assert list(stats_df.columns) == [
+        "identifier",
+        "label_name",
+        "record_coverage",
+        "source_conflicts",
+        "source_overlaps",
+    ]
+    assert to_rows(stats_df) == [
+        ("h1", "a", 3, 1, 1),
+        ("h1", "b", 1, 1, 0),
+        ("h2", "a", 3, 2, 1),
+        ("h2", "b", 2, 1, 2),
+        ("h3", "b", 1, 0, 0),
+        ("h3", "a", 1, 0, 0),
+        ("h4", "b", 3, 2, 2),
+    ]
+
+
+def test_weakly_supervise():
+    # r6 and r7 only have votes without precision, r9 is a tie between h2 and h4
+    assert CNLM(create_vectors()).weakly_supervise().sort_index().to_dict() == {
+        "r1": ("a", pytest.approx(0.9997254218438986)),
+        "r2": ("b", pytest.approx(0.9993020512340489)),
+        "r3": ("a", pytest.approx(0.8411308951190848)),
+        "r4": ("b", pytest.approx(0.9994472213630764)),
+        "r5": ("a", pytest.approx(0.9820137900379085)),
+        "r6": None,
+        "r7": None,
+        "r9": None,
+    }
+
+
+def test_int_labels():
+    assert to_rows(CNLM(create_int_label_vectors()).quality_metrics()) == [
+        ("h1", 1, 1, 1, 0.5),
+        ("h1", 2, 0, 0, 0.0),
+        ("h2", 2, 1, 0, 1.0),
+        ("h2", 1, 0, 0, 0.0),
+    ]
+    assert to_rows(CNLM(create_int_label_vectors()).quantity_metrics()) == [
+        ("h1", 1, 2, 1, 0),
+        ("h1", 2, 1, 0, 1),
+        ("h2", 2, 2, 1, 1),
+    ]
+    weak_labels = CNLM(create_int_label_vectors()).weakly_supervise().sort_index()
+    assert weak_labels.to_dict() == {
+        "r1": (1, pytest.approx(0.3658644089891992)),
+        "r2": (2, pytest.approx(0.09112296101485608)),
+        "r3": (2, pytest.approx(0.9820137900379085)),
+    }
+    assert not any(isinstance(label, float) for label, _ in weak_labels)
+
+
+def test_label_columns_of_vectors_stay_untouched():
+    vectors = [
+        SourceVector(
+            "reference",
+            True,
+            [ClassificationAssociation("r1", 1), ClassificationAssociation("r2", 2)],
+        ),
+        SourceVector(
+            "heuristic_1",
+            False,
+            [ClassificationAssociation("r1", "a"), ClassificationAssociation("r2", 2)],
+        ),
+        SourceVector(
+            "heuristic_2",
+            False,
+            [
+                ClassificationAssociation("r1", None),
+                ClassificationAssociation("r2", None),
+            ],
+        ),
+    ]
+    dtypes = [vector.associations["label"].dtype for vector in vectors]
+    cnlm = CNLM(vectors)
+    cnlm.quality_metrics()
+    cnlm.quantity_metrics()
+    assert [vector.associations["label"].dtype for vector in vectors] == dtypes
+
+
+def test_duplicate_statistics_raise():
+    cnlm = CNLM(
+        [
+            SourceVector("reference", True, [ClassificationAssociation("r1", "a")]),
+            SourceVector("h", False, [ClassificationAssociation("r1", "a")]),
+            SourceVector("h", False, [ClassificationAssociation("r1", "b")]),
+        ]
+    )
+    with pytest.raises(ValueError):
+        cnlm.weakly_supervise()
@@ -1,4 +1,5 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional
+import numpy as np
 import pandas as pd
 from weak_nlp import base
 from weak_nlp.classification import util
@@ -29,59 +30,109 @@ class CNLM(base.NoisyLabelMatrix):
 
     def __init__(self, vectors: base.SourceVector):
         super().__init__(vectors)
+        # Labels are low-cardinality strings that are compared and grouped a lot,
+        # so the metrics work on categoricals sharing one set of categories; this way,
+        # comparisons between vectors run on integer codes
+        vectors = [
+            vector
+            for vector in self.vectors_noisy + [self.vector_reference]
+            if vector is not None and not vector.is_empty
+        ]
+        if len(vectors) > 0:
+            self.label_categories = pd.Index(
+                pd.unique(
+                    pd.concat(
+                        [vector.associations["label"].dropna() for vector in vectors]
+                    ).astype(object)
+                ),
+                dtype=object,
+            )
+        else:
+            self.label_categories = pd.Index([], dtype=object)
+
+    def _with_label_categories(self, df: pd.DataFrame) -> pd.DataFrame:
+        # returns a new frame, the associations of the source vectors stay untouched
+        return df.assign(
+            label=pd.Categorical(df["label"], categories=self.label_categories)
+        )
 
     def _set_quality_metrics_inplace(self) -> None:
+        self._collect_quality_statistics()
+
+    def _collect_quality_statistics(self) -> List[Dict[str, Any]]:
+        # Sets the quality metrics inplace and returns them as statistics rows
         # There is one reference vector, which has been manually labeled (e.g. in the UI)
         # we compare that vector to all other N vectors (that is we make N comparisons).
         # This way, we can easily compute the quality of one noisy heuristic
         # We do so via joining the sets on which we have pairs, and compare the actual and noisy label
-        reference_labels = list(
-            self.vector_reference.associations["label"].dropna().unique()
-        )
+        statistics = []
+        df_reference = self._with_label_categories(self.vector_reference.associations)
+        reference_labels = list(df_reference["label"].dropna().unique())
         for idx, vector_noisy in enumerate(self.vectors_noisy):
             if not vector_noisy.is_empty:
+                df_noisy = self._with_label_categories(vector_noisy.associations)
                 quality = {}
-                noisy_labels = list(
-                    vector_noisy.associations["label"].dropna().unique()
-                )
+                noisy_labels = list(df_noisy["label"].dropna().unique())
                 for label_name in noisy_labels + reference_labels:
                     quality[label_name] = {
                         "true_positives": 0,
                         "false_positives": 0,
                     }
 
-                df_inner_join = (
-                    self.vector_reference.associations.set_index("record")
-                    .join(
-                        vector_noisy.associations.set_index("record"),
-                        how="inner",
-                        lsuffix="_reference",
-                        rsuffix="_noisy",
-                    )
-                    .reset_index()
+                df_inner_join = pd.merge(
+                    df_reference,
+                    df_noisy,
+                    on="record",
+                    how="inner",
+                    suffixes=("_reference", "_noisy"),
                 )
-
-                for label_name, df_grouped in df_inner_join.groupby("label_noisy"):
-                    num_intersections = len(df_grouped)
-                    true_positives = (
-                        df_grouped["label_reference"] == df_grouped["label_noisy"]
-                    ).sum()
-                    false_positives = num_intersections - true_positives
-                    quality[label_name] = {
-                        "true_positives": true_positives,
-                        "false_positives": false_positives,
+                if not df_inner_join.empty:
+                    # heuristics without overlap to the reference have nothing to count
+                    label_matches = (
+                        df_inner_join["label_reference"]
+                        == df_inner_join["label_noisy"]
+                    )
+                    df_counts = label_matches.groupby(
+                        df_inner_join["label_noisy"], observed=True
+                    ).agg(true_positives="sum", num_intersections="size")
+                    for label_name, row in df_counts.iterrows():
+                        true_positives = row["true_positives"]
+                        false_positives = row["num_intersections"] - true_positives
+                        quality[label_name] = {
+                            "true_positives": true_positives,
+                            "false_positives": false_positives,
+                        }
+                self.vectors_noisy[idx].quality = quality
+                statistics.extend(
+                    {
+                        "identifier": vector_noisy.identifier,
+                        "label_name": label_name,
+                        "true_positives": label_quality["true_positives"],
+                        "false_positives": label_quality["false_positives"],
                     }
-                self.vectors_noisy[idx].quality = quality.copy()
+                    for label_name, label_quality in quality.items()
+                )
+        return statistics
 
     def _set_quantity_metrics_inplace(self) -> None:
+        self._collect_quantity_statistics()
+
+    def _collect_quantity_statistics(self) -> List[Dict[str, Any]]:
+        # Sets the quantity metrics inplace and returns them as statistics rows
         # We don't need the manually labeled reference vector for this; however,
         # we require all other heuristics of that task. We always look at one specific
         # heuristic (source), and compare all N-1 other heuristics against it
+        statistics = []
         df_noisy_vectors = common_util.get_all_noisy_vectors_df(self)
+        if "record" not in df_noisy_vectors:
+            # all noisy vectors are empty, so there is nothing to compare
+            return statistics
+        df_noisy_vectors = self._with_label_categories(df_noisy_vectors)
+        records_per_source = df_noisy_vectors.groupby("source")["record"].unique()
         for source, df_source in df_noisy_vectors.groupby("source"):
             df_without_source = df_noisy_vectors.loc[
                 (df_noisy_vectors["source"] != source)
-                & (df_noisy_vectors["record"].isin(df_source.record.unique()))
+                & (df_noisy_vectors["record"].isin(records_per_source[source]))
                 # no need to load parts of other heuristics we don't care about for this heuristic
             ]
             quantity = {
@@ -92,57 +143,74 @@ class CNLM(base.NoisyLabelMatrix):
                 }
                 for label in df_source["label"].dropna().unique()
             }
-            for record_series in df_without_source.groupby("record")["label"]:
-                record_id, labels = record_series
-                labels_unique = labels.unique()  # e.g. ["clickbait", "regular"]
-                row_source = df_source.loc[df_source["record"] == record_id].iloc[0]
-                label = row_source.label  # e.g. "clickbait"
-                if label in labels_unique:
-                    quantity[label]["source_overlaps"] += 1
-                if len(labels_unique) > 1 or labels_unique[0] != label:
-                    quantity[label]["source_conflicts"] += 1
+            df_source_unique = df_source.drop_duplicates("record")
+            source_label_by_record = dict(
+                zip(
+                    df_source_unique["record"].to_numpy(),
+                    df_source_unique["label"].to_numpy(),
+                )
+            )  # hash lookup instead of scanning df_source for each record
+            # a record overlaps if any other heuristic agrees with the source label,
+            # and conflicts if any other heuristic assigns a different label
+            source_labels = df_without_source["record"].map(source_label_by_record)
+            label_matches = df_without_source["label"] == source_labels
+            df_per_record = (
+                pd.DataFrame(
+                    {
+                        "record": df_without_source["record"],
+                        "source_label": source_labels,
+                        "overlap": label_matches,
+                        "conflict": ~label_matches,
+                    }
+                )
+                .groupby("record")
+                .agg(
+                    source_label=("source_label", "first"),
+                    overlap=("overlap", "any"),
+                    conflict=("conflict", "any"),
+                )
+            )
+            df_per_label = df_per_record.groupby("source_label")[
+                ["overlap", "conflict"]
+            ].sum()
+            for label, row in df_per_label.iterrows():
+                quantity[label]["source_overlaps"] = int(row["overlap"])
+                quantity[label]["source_conflicts"] = int(row["conflict"])
 
             for idx, vector in enumerate(self.vectors_noisy):
                 if vector.identifier == source:
-                    self.vectors_noisy[idx].quantity = quantity.copy()
+                    self.vectors_noisy[idx].quantity = quantity
+            statistics.extend(
+                {
+                    "identifier": source,
+                    "label_name": label_name,
+                    "record_coverage": label_quantity["record_coverage"],
+                    "source_conflicts": label_quantity["source_conflicts"],
+                    "source_overlaps": label_quantity["source_overlaps"],
+                }
+                for label_name, label_quantity in quantity.items()
+            )
+        return statistics
 
     def quality_metrics(self) -> pd.DataFrame:
         if self.vector_reference is None:
             raise exceptions.MissingReferenceException(
                 "Can't calculate the quality metrics without reference vector"
             )
-        self._set_quality_metrics_inplace()
-
-        statistics = []
-        for vector_noisy in self.vectors_noisy:
-            vector_stats = {"identifier": vector_noisy.identifier}
-            for label_name in vector_noisy.quality.keys():
-                vector_stats["label_name"] = label_name
-                quality = vector_noisy.quality[label_name]
-
-                vector_stats["true_positives"] = quality["true_positives"]
-                vector_stats["false_positives"] = quality["false_positives"]
-                statistics.append(vector_stats.copy())
+        statistics = self._collect_quality_statistics()
 
         stats_df = pd.DataFrame(statistics)
         if len(stats_df) > 0:
-            stats_df["precision"] = stats_df.apply(common_util.calc_precision, axis=1)
+            true_positives = stats_df["true_positives"].to_numpy()
+            false_positives = stats_df["false_positives"].to_numpy()
+            denominator = true_positives + false_positives
+            stats_df["precision"] = np.where(
+                denominator == 0, 0.0, true_positives / np.maximum(denominator, 1)
+            )
         return stats_df
 
     def quantity_metrics(self) -> pd.DataFrame:
-        self._set_quantity_metrics_inplace()
-
-        statistics = []
-        for vector_noisy in self.vectors_noisy:
-            vector_stats = {"identifier": vector_noisy.identifier}
-            for label_name in vector_noisy.quantity.keys():
-                vector_stats["label_name"] = label_name
-
-                quantity = vector_noisy.quantity[label_name]
-                vector_stats["record_coverage"] = quantity["record_coverage"]
-                vector_stats["source_conflicts"] = quantity["source_conflicts"]
-                vector_stats["source_overlaps"] = quantity["source_overlaps"]
-                statistics.append(vector_stats.copy())
+        statistics = self._collect_quantity_statistics()
 
         stats_df = pd.DataFrame(statistics)
         return stats_df
@@ -153,29 +221,71 @@ class CNLM(base.NoisyLabelMatrix):
             raise exceptions.MissingStatsException(
                 "Empty statistics; can't compute weak supervision"
             )
-        stats_lkp = stats_df.set_index(["identifier", "label_name"]).to_dict(
-            orient="index"
+        if stats_df.duplicated(["identifier", "label_name"]).any():
+            raise ValueError(
+                "Statistics contain duplicate heuristic and label pairs; "
+                "source vector identifiers must be unique"
+            )
+        stats_lkp = dict(
+            zip(
+                zip(
+                    stats_df["identifier"].to_numpy(),
+                    stats_df["label_name"].to_numpy(),
+                ),
+                stats_df["precision"].to_numpy(),
+            )
         )  # pairwise [heuristic, label] lookup for precision
 
         # We can collect *all* heuristic results for this noisy label matrix
-        # and apply weight lookups for each prediction
-        cnlm_df = pd.DataFrame(self.records, columns=["record"])
-        cnlm_df = cnlm_df.set_index("record")
+        # and apply weight lookups for each prediction; labels and weighted
+        # confidences are kept in separate columns so that the ensemble can be
+        # computed for all records at once
+        records = pd.Index(list(self.records), name="record")
+        label_columns = {}
+        confidence_columns = {}
+        is_covered = np.zeros(len(records), dtype=bool)
         for vector in self.vectors_noisy:
             vector_df = vector.associations
+            vector_id = vector.identifier
             if len(vector_df) > 0:
-                vector_df["prediction"] = vector_df.apply(
-                    lambda x: [
-                        x["label"],
-                        stats_lkp[(vector.identifier, x["label"])]["precision"]
-                        * (x["confidence"]),
-                    ],
-                    axis=1,
+                vector_labels = vector_df["label"]
+                precision_by_label = {
+                    label_name: stats_lkp[(vector_id, label_name)]
+                    for label_name in vector_labels.unique()
+                }
+                weighted_confidences = (
+                    vector_labels.map(precision_by_label).to_numpy()
+                    * vector_df["confidence"].to_numpy()
                 )
-                vector_series = vector_df.set_index("record")["prediction"]
-                cnlm_df[vector.identifier] = vector_series
-        cnlm_df = cnlm_df.loc[~(cnlm_df.isnull()).all(axis=1)].fillna(
-            "-"
-        )  # hard to deal with np.nan
+                vector_records = vector_df["record"].to_numpy()
+                vector_label_codes = pd.Categorical(
+                    vector_labels, categories=self.label_categories
+                ).codes
+                label_columns[vector_id] = pd.Series(
+                    vector_label_codes, index=vector_records
+                ).reindex(records, fill_value=-1)
+                is_covered |= label_columns[vector_id].to_numpy() >= 0
+                confidence_columns[vector_id] = pd.Series(
+                    weighted_confidences, index=vector_records
+                ).reindex(records)
+        labels_df = pd.concat(label_columns, axis=1)
+        confidences_df = pd.concat(confidence_columns, axis=1)
 
-        return cnlm_df.apply(util._ensemble, axis=1, c=c, k=k)
+        labels_df = labels_df.loc[is_covered]
+        confidences_df = confidences_df.loc[is_covered]
+
+        label_codes = labels_df.to_numpy()
+        label_names = self.label_categories
+        confidences = confidences_df.to_numpy(dtype=float)
+
+        max_voters, confidences = util._ensemble(
+            label_codes, confidences, len(label_names), c=c, k=k
+        )
+        return pd.Series(
+            [
+                None if np.isnan(confidence) else (label_names[max_voter], confidence)
+                for max_voter, confidence in zip(max_voters, confidences)
+            ],
+            index=labels_df.index,
+            dtype=object,
+        )
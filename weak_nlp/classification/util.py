@@ -1,33 +1,41 @@
-from collections import defaultdict
-from typing import Optional, Tuple
-import pandas as pd
+from typing import Tuple
+import numpy as np
 
 from weak_nlp.shared import common_util
 
 
-def _ensemble(row: pd.Series, c: int, k: int) -> Optional[Tuple[str, float]]:
-    """Integrates all relevant data from a given noisy label matrix row into one weakly supervised classification
+def _ensemble(
+    label_codes: np.ndarray, confidences: np.ndarray, num_labels: int, c: int, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Integrates all relevant data from a given noisy label matrix into weakly supervised classifications
 
     Args:
-        row (pd.Series): Single row from a DataFrame
+        label_codes (np.ndarray): Label code per record (row) and heuristic (column); -1 if the heuristic has no vote
+        confidences (np.ndarray): Weighted confidence per record (row) and heuristic (column)
+        num_labels (int): Number of distinct label codes
         c (int): slope of the function
         k (int): what input should yield 0.5 probability?
 
     Returns:
-        Optional[Tuple[str, float]]: Weakly supervised label and confidence; If confidence <= 0, this returns None.
+        Tuple[np.ndarray, np.ndarray]: Weakly supervised label code and confidence per record; If confidence <= 0, it is NaN.
     """
-    voters = defaultdict(float)
-    for column in row.keys():
-        pair_or_empty = row[column]
-        if pair_or_empty != "-":
-            label_name, confidence = pair_or_empty
-            voters[label_name] += confidence
+    num_records = label_codes.shape[0]
+    record_idxs = np.arange(num_records)
+    is_voting = label_codes >= 0
+    # one flat bin per (record, label) pair, summed in a single pass
+    vote_bins = (record_idxs[:, None] * num_labels + label_codes)[is_voting]
+    votes = np.bincount(
+        vote_bins,
+        weights=confidences[is_voting],
+        minlength=num_records * num_labels,
+    ).reshape(num_records, num_labels)
 
-    max_voter = max(voters, key=voters.get)  # e.g. clickbait
-    sum_votes = sum(list(voters.values()))
-    max_vote = voters[max_voter]
+    max_voters = votes.argmax(axis=1)  # e.g. code of clickbait
+    max_votes = votes[record_idxs, max_voters]
+    sum_votes = votes.sum(axis=1)
 
-    confidence = max_vote - (sum_votes - max_vote)
-    if confidence > 0:
-        confidence = common_util.sigmoid(confidence, c=c, k=k)
-        return max_voter, confidence
+    margins = 2 * max_votes - sum_votes  # i.e. max vote minus all other votes
+    is_positive = margins > 0
+    confidence = np.full(num_records, np.nan)
+    confidence[is_positive] = common_util.sigmoid(margins[is_positive], c=c, k=k)
+    return max_voters, confidence
@@ -4,12 +4,11 @@ from weak_nlp import base
 
 
 def get_all_noisy_vectors_df(nlm: base.NoisyLabelMatrix):
-    dfs = []
-    for vector in nlm.vectors_noisy:
-        df = pd.DataFrame(vector.associations)
-        df["source"] = vector.identifier
-        dfs.append(df)
-    return pd.concat(dfs)
+    return pd.concat(
+        [vector.associations for vector in nlm.vectors_noisy],
+        keys=[vector.identifier for vector in nlm.vectors_noisy],
+        names=["source", None],
+    ).reset_index(level="source")
 
 
 def calc_precision(row):